@@ -3,27 +3,36 @@ import numpy as np
 import warnings
 warnings.filterwarnings('ignore')
 
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import f1_score
-from sklearn.feature_selection import VarianceThreshold
 
 import xgboost as xgb
 import lightgbm as lgb
 import catboost as cb
+from catboost.utils import get_gpu_device_count
 
 # import torch
 # import torch.nn as nn
 
 from tqdm import tqdm
 from scipy import signal
-from scipy.spatial.distance import euclidean
-from fastdtw import fastdtw
+from numpy.lib.stride_tricks import sliding_window_view
+from numba import njit
 
 import joblib
+from joblib import Parallel, delayed
 import argparse
+import hashlib
 import os
 import pickle
+import shutil
+
+class _NumpyCompatUnpickler(pickle.Unpickler):
+    """将新版numpy的 numpy._core 模块路径映射回 numpy.core"""
+    def find_class(self, module, name):
+        if module.startswith('numpy._core'):
+            module = 'numpy.core' + module[len('numpy._core'):]
+        return super().find_class(module, name)
+
 
 def safe_joblib_load(filepath):
     """安全加载joblib文件，处理numpy兼容性问题"""
@@ -32,18 +41,28 @@ def safe_joblib_load(filepath):
     except ModuleNotFoundError as e:
         if 'numpy._core' in str(e):
             print(f"修复numpy兼容性问题: {filepath}")
-            # 手动修复pickle文件
+            # 流式反序列化，加载时改写numpy引用，无需整文件读入
             with open(filepath, 'rb') as f:
-                data = f.read()
-            
-            # 修复numpy引用
-            data = data.replace(b'numpy._core', b'numpy.core')
-            
-            # 使用pickle加载
-            return pickle.loads(data)
+                return _NumpyCompatUnpickler(f).load()
         else:
             raise e
 
+def xgb_cuda_available():
+    """检测XGBoost能否使用CUDA：以CUDA编译且存在NVIDIA驱动"""
+    try:
+        return bool(xgb.build_info().get('USE_CUDA')) and shutil.which('nvidia-smi') is not None
+    except Exception:
+        return False
+
+
+def cat_gpu_available():
+    """检测CatBoost能否使用GPU：可见GPU设备数大于0"""
+    try:
+        return get_gpu_device_count() > 0
+    except Exception:
+        return False
+
+
 # ==================== 配置参数 ====================
 class Config:
     RANDOM_SEED = 42
@@ -82,48 +101,45 @@ def macro_f1_with_tolerance(y_true, y_pred, well_ids, tolerance_first=1, toleran
     y_true_adjusted = y_true.copy()
     y_pred_adjusted = y_pred.copy()
 
-    for well_id in np.unique(well_ids):
-        mask = well_ids == well_id
-        indices = np.where(mask)[0]
-
-        true_labels = y_true[mask]
-        pred_labels = y_pred[mask]
-
-        # 找出真实的关键点位置
-        true_keypoints = {}
-        for kp in [1, 2, 3]:
-            kp_indices = indices[true_labels == kp]
-            if len(kp_indices) > 0:
-                true_keypoints[kp] = kp_indices[0]  # 假设每类只有一个
-
-        # 找出预测的关键点位置
-        pred_keypoints = {}
-        for kp in [1, 2, 3]:
-            kp_indices = indices[pred_labels == kp]
-            if len(kp_indices) > 0:
-                pred_keypoints[kp] = kp_indices[0]
-
-        # 应用容错机制
-        for kp in [1, 2, 3]:
-            if kp in true_keypoints and kp in pred_keypoints:
-                true_pos = true_keypoints[kp]
-                pred_pos = pred_keypoints[kp]
-
-                # 确定容错范围
-                tolerance = tolerance_first if kp == 1 else tolerance_rest
-
-                if abs(true_pos - pred_pos) <= tolerance:
-                    # 在容错范围内，将预测位置调整为真实位置
-                    local_pred_idx = np.where(indices == pred_pos)[0][0]
-                    local_true_idx = np.where(indices == true_pos)[0][0]
-                    y_pred_adjusted[pred_pos] = 0  # 清除预测位置
-                    y_pred_adjusted[true_pos] = kp  # 标记为真实位置
+    m = pd.DataFrame({'w': well_ids, 't': y_true, 'p': y_pred, 'i': np.arange(len(y_true))})
+
+    for kp in [1, 2, 3]:
+        # 每口井每类的真实/预测关键点位置（假设每类只有一个，取第一个）
+        true_pos = m.loc[m['t'] == kp].groupby('w', sort=False)['i'].min()
+        pred_pos = m.loc[m['p'] == kp].groupby('w', sort=False)['i'].min()
+        pos = pd.concat([true_pos.rename('t'), pred_pos.rename('p')], axis=1, join='inner')
+
+        # 确定容错范围
+        tolerance = tolerance_first if kp == 1 else tolerance_rest
+
+        # 在容错范围内，将预测位置调整为真实位置
+        in_tol = pos[(pos['t'] - pos['p']).abs() <= tolerance]
+        y_pred_adjusted[in_tol['p'].to_numpy()] = 0  # 清除预测位置
+        y_pred_adjusted[in_tol['t'].to_numpy()] = kp  # 标记为真实位置
 
     # 计算调整后的Macro F1
     return f1_score(y_true_adjusted, y_pred_adjusted, average='macro', zero_division=0)
 
 
 # ==================== 2. 从设计轨迹提取先验关键点 ====================
+# 先验关键点缓存：设计井斜角序列摘要 -> 关键点，多口井共用同一设计时只计算一次
+_kp_cache = {}
+
+# 11点二阶Savitzky-Golay系数：中心卷积核 + 两端多项式拟合的逐位置系数
+_SAVGOL11 = signal.savgol_coeffs(11, 2)
+_SAVGOL11_EDGE = np.array([signal.savgol_coeffs(11, 2, pos=p, use='dot') for p in range(11)])
+
+
+def _savgol11(x):
+    """
+    等价于 signal.savgol_filter(x, 11, 2)，系数预先计算，要求 len(x) >= 11
+    """
+    smooth = np.convolve(x, _SAVGOL11, mode='same')
+    smooth[:5] = _SAVGOL11_EDGE[:5] @ x[:11]
+    smooth[-5:] = _SAVGOL11_EDGE[6:] @ x[-11:]
+    return smooth
+
+
 def extract_keypoints_from_design(design_data):
     """
     从设计轨迹中提取理论关键点位置
@@ -132,77 +148,309 @@ def extract_keypoints_from_design(design_data):
     if design_data is None or len(design_data) == 0:
         return {}
 
-    jx_design = design_data['JX_design'].values
-    xjs = design_data['XJS'].values
+    jx_design = np.ascontiguousarray(design_data['JX_design'].values, dtype=np.float64)
+
+    # 设计轨迹过短（不足21点时没有可扫描的位置）或井斜角几乎不变（如直井段）时不存在关键点，跳过滤波和扫描
+    if len(jx_design) < 21 or np.ptp(jx_design) < 1e-3:
+        return {}
+
+    cache_key = hashlib.blake2b(jx_design.tobytes(), digest_size=8).digest()
+    if cache_key in _kp_cache:
+        return _kp_cache[cache_key]
+
+    keypoints = {}
+    n = len(jx_design)
 
     # 计算井斜角变化率
     jx_diff = np.diff(jx_design, prepend=jx_design[0])
-    jx_diff_smooth = signal.savgol_filter(jx_diff, window_length=min(11, len(jx_diff)), polyorder=2)
+    jx_diff_smooth = _savgol11(jx_diff)
 
-    keypoints = {}
+    # 扫描位置i的前5点均值、后5点均值、后10点均值
+    i = np.arange(10, n - 10)
+    mean5 = sliding_window_view(jx_diff_smooth, 5).mean(axis=1)
+    mean10 = sliding_window_view(jx_diff_smooth, 10).mean(axis=1)
+    before, after5, after10 = mean5[i - 5], mean5[i], mean10[i]
 
     # 寻找增斜点：变化率从接近0变为显著正值
-    for i in range(10, len(jx_diff_smooth) - 10):
-        if jx_diff_smooth[i-5:i].mean() < 0.05 and jx_diff_smooth[i:i+5].mean() > 0.15:
-            keypoints[1] = i
-            break
+    candidates = i[(before < 0.05) & (after5 > 0.15)]
+    if len(candidates) > 0:
+        keypoints[1] = int(candidates[0])
 
     # 寻找稳斜点：变化率从正值变为接近0
     if 1 in keypoints:
-        for i in range(keypoints[1] + 20, len(jx_diff_smooth) - 10):
-            if jx_diff_smooth[i-5:i].mean() > 0.1 and abs(jx_diff_smooth[i:i+10].mean()) < 0.05:
-                keypoints[2] = i
-                break
+        candidates = i[(before > 0.1) & (np.abs(after10) < 0.05)]
+        pos = np.searchsorted(candidates, keypoints[1] + 20)
+        if pos < len(candidates):
+            keypoints[2] = int(candidates[pos])
 
     # 寻找降斜点：变化率从接近0变为显著负值
     if 2 in keypoints:
-        for i in range(keypoints[2] + 20, len(jx_diff_smooth) - 10):
-            if abs(jx_diff_smooth[i-5:i].mean()) < 0.05 and jx_diff_smooth[i:i+5].mean() < -0.1:
-                keypoints[3] = i
-                break
+        candidates = i[(np.abs(before) < 0.05) & (after5 < -0.1)]
+        pos = np.searchsorted(candidates, keypoints[2] + 20)
+        if pos < len(candidates):
+            keypoints[3] = int(candidates[pos])
 
+    _kp_cache[cache_key] = keypoints
     return keypoints
 
 
+@njit(cache=True)
+def _banded_dtw(A, B, radius):
+    """
+    Sakoe-Chiba带状约束的DTW（numba编译）
+    只计算沿缩放对角线、半径radius带内的累计代价，返回对齐路径(des_idx, act_idx)
+    """
+    n, m = A.shape[0], B.shape[0]
+    width = 2 * radius + 1
+
+    # 第i行带内第k格对应列 lo[i] + k
+    lo = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        lo[i] = (i * (m - 1)) // max(n - 1, 1) - radius
+
+    cost = np.full((n, width), np.inf)
+    for i in range(n):
+        for k in range(width):
+            j = lo[i] + k
+            if j < 0 or j >= m:
+                continue
+
+            # 欧氏距离
+            d = 0.0
+            for c in range(A.shape[1]):
+                diff = A[i, c] - B[j, c]
+                d += diff * diff
+            d = np.sqrt(d)
+
+            if i == 0 and j == 0:
+                prev = 0.0
+            else:
+                prev = np.inf
+                if k > 0:
+                    prev = min(prev, cost[i, k - 1])
+                if i > 0:
+                    kk = j - lo[i - 1]
+                    if 0 <= kk < width:
+                        prev = min(prev, cost[i - 1, kk])
+                    if 1 <= kk <= width:
+                        prev = min(prev, cost[i - 1, kk - 1])
+            cost[i, k] = d + prev
+
+    # 回溯路径，同代价时优先走对角线
+    des_idx = np.empty(n + m, dtype=np.int64)
+    act_idx = np.empty(n + m, dtype=np.int64)
+    i, j = n - 1, m - 1
+    p = 0
+    while True:
+        des_idx[p] = i
+        act_idx[p] = j
+        p += 1
+        if i == 0 and j == 0:
+            break
+        if i == 0:
+            j -= 1
+            continue
+        if j == 0:
+            i -= 1
+            continue
+
+        diag = up = left = np.inf
+        kk = j - 1 - lo[i - 1]
+        if 0 <= kk < width:
+            diag = cost[i - 1, kk]
+        if 0 <= kk + 1 < width:
+            up = cost[i - 1, kk + 1]
+        kk = j - 1 - lo[i]
+        if 0 <= kk < width:
+            left = cost[i, kk]
+
+        if diag <= up and diag <= left:
+            i -= 1
+            j -= 1
+        elif up <= left:
+            i -= 1
+        else:
+            j -= 1
+
+    return des_idx[:p][::-1], act_idx[:p][::-1]
+
+
 def align_design_to_actual(design_data, actual_data):
     """
     使用DTW对齐设计轨迹和实际轨迹
-    返回对齐的索引映射
+    返回对齐的索引映射（ndarray，下标为design_idx，值为对齐的actual_idx，-1表示无对齐）
     """
     if design_data is None or len(design_data) == 0:
         return None
 
     # 提取关键特征用于对齐
-    design_features = design_data[['JX_design', 'LJCZJS_design']].values
-    actual_features = actual_data[['JX', 'LJCZJS']].values
+    design_features = design_data[['JX_design', 'LJCZJS_design']].values.astype(np.float64)
+    actual_features = actual_data[['JX', 'LJCZJS']].values.astype(np.float64)
+
+    # 含NaN/inf时无法对齐（LJCZJS中的N/A会被转为NaN）
+    if not (np.isfinite(design_features).all() and np.isfinite(actual_features).all()):
+        return None
 
     # 标准化
     design_features = (design_features - design_features.mean(axis=0)) / (design_features.std(axis=0) + 1e-6)
     actual_features = (actual_features - actual_features.mean(axis=0)) / (actual_features.std(axis=0) + 1e-6)
 
-    # DTW对齐
-    try:
-        distance, path = fastdtw(design_features, actual_features, dist=euclidean)
+    # 带状DTW对齐：半径取较长序列的10%（至少50），并覆盖两序列长度比造成的对角线斜率
+    n, m = len(design_features), len(actual_features)
+    radius = max(50, int(0.1 * max(n, m)), -(-max(n, m) // min(n, m)) + 1)
+    des_idx, act_idx = _banded_dtw(design_features, actual_features, radius)
 
-        # 构建映射：design_idx -> actual_idx
-        alignment_map = {}
-        for design_idx, actual_idx in path:
-            if design_idx not in alignment_map:
-                alignment_map[design_idx] = []
-            alignment_map[design_idx].append(actual_idx)
+    # 取平均作为最佳对齐位置，未出现在路径上的design_idx记为-1
+    cnt = np.bincount(des_idx, minlength=n)
+    total = np.bincount(des_idx, weights=act_idx.astype(np.float64), minlength=n)
 
-        # 取平均作为最佳对齐位置
-        alignment_map = {k: int(np.mean(v)) for k, v in alignment_map.items()}
+    return np.where(cnt > 0, total / np.maximum(cnt, 1), -1).astype(np.int32)
 
-        return alignment_map
-    except:
-        return None
+
+@njit(cache=True)
+def _segment_rolling_mean_std(values, seg_start, seg_end, left, right):
+    """
+    分段滑窗均值/标准差：窗口[i-left, i+right]截断在所在段内（numba编译）
+    单遍流式更新，均值用Kahan补偿求和、方差用Welford在线更新，
+    与逐段 rolling(min_periods=1).mean()/std() 逐位一致（单点窗口std取0）
+    """
+    n = len(values)
+    mean = np.zeros(n)
+    std = np.zeros(n)
+
+    nobs = 0
+    neg_ct = 0
+    same_ct = 0
+    prev_value = 0.0
+    sum_x = comp_add = comp_remove = 0.0
+    mean_x = ssqdm_x = var_comp_add = var_comp_remove = 0.0
+    prev_s = prev_e = 0
+
+    for i in range(n):
+        s = max(i - left, seg_start[i])
+        e = min(i + right + 1, seg_end[i])
+
+        if i == 0 or s >= prev_e:
+            # 新段（或与上一窗口不重叠）：重置状态
+            nobs = neg_ct = same_ct = 0
+            prev_value = values[s]
+            sum_x = comp_add = comp_remove = 0.0
+            mean_x = ssqdm_x = var_comp_add = var_comp_remove = 0.0
+            add_from, add_to = s, e
+        else:
+            # 移出窗口左侧的点
+            for j in range(prev_s, s):
+                val = values[j]
+                nobs -= 1
+                y = -val - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+                if np.signbit(val):
+                    neg_ct -= 1
+                if nobs > 0:
+                    prev_mean = mean_x - var_comp_remove
+                    y = val - var_comp_remove
+                    t = y - mean_x
+                    var_comp_remove = t + mean_x - y
+                    mean_x = mean_x - t / nobs
+                    ssqdm_x = ssqdm_x - (val - prev_mean) * (val - mean_x)
+                else:
+                    mean_x = ssqdm_x = 0.0
+            add_from, add_to = prev_e, e
+
+        # 加入窗口右侧的点
+        for j in range(add_from, add_to):
+            val = values[j]
+            nobs += 1
+            y = val - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            if np.signbit(val):
+                neg_ct += 1
+            if val == prev_value:
+                same_ct += 1
+            else:
+                same_ct = 1
+            prev_value = val
+            prev_mean = mean_x - var_comp_add
+            y = val - var_comp_add
+            t = y - mean_x
+            var_comp_add = t + mean_x - y
+            mean_x = mean_x + t / nobs
+            ssqdm_x = ssqdm_x + (val - prev_mean) * (val - mean_x)
+
+        # 均值：全同值窗口取该值，全非负/全负窗口消除符号舍入误差
+        result = sum_x / nobs
+        if same_ct >= nobs:
+            result = prev_value
+        elif neg_ct == 0 and result < 0:
+            result = 0.0
+        elif neg_ct == nobs and result > 0:
+            result = 0.0
+        mean[i] = result
+
+        # 标准差：单点或全同值窗口为0
+        if nobs > 1 and same_ct < nobs and ssqdm_x > 0:
+            std[i] = np.sqrt(ssqdm_x / (nobs - 1))
+
+        prev_s, prev_e = s, e
+
+    return mean, std
+
+
+def _segment_fill(values, seg_start, seg_end):
+    """
+    段内先前向填充、再后向填充，整段缺失填0，等价于逐段 ffill().bfill().fillna(0)
+    """
+    pos = np.arange(len(values))
+    valid = ~np.isnan(values)
+
+    # 之前最近的有效位置（需在段内），否则取之后最近的有效位置
+    prev_valid = np.maximum.accumulate(np.where(valid, pos, -1))
+    next_valid = np.minimum.accumulate(np.where(valid, pos, len(values))[::-1])[::-1]
+    src = np.where(prev_valid >= seg_start, prev_valid, np.where(next_valid < seg_end, next_valid, -1))
+
+    return np.where(src >= 0, values[src], 0)
+
+
+def _segment_pct_rank(values, starts, sizes):
+    """
+    按连续分段计算百分位名次，等价于逐段 Series.rank(pct=True)（同值取平均名次，NaN不参与）
+    """
+    n = len(values)
+    seg_start = np.repeat(starts, sizes)
+    seg_id = np.repeat(np.arange(len(sizes)), sizes)
+
+    # 段内按值排序，分段顺序不变
+    order = np.lexsort((values, seg_id))
+    sorted_values = values[order]
+    pos = np.arange(n)
+
+    # 同值区间的首尾位置
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = (sorted_values[1:] != sorted_values[:-1]) | (seg_id[1:] != seg_id[:-1])
+    run_first = np.maximum.accumulate(np.where(new_run, pos, 0))
+    run_end = np.append(new_run[1:], True)
+    run_last = np.minimum.accumulate(np.where(run_end, pos, n)[::-1])[::-1]
+
+    valid = ~np.isnan(values)
+    n_valid = np.repeat(np.add.reduceat(valid, starts), sizes)
+    avg_rank = (run_first + run_last) / 2 - seg_start + 1
+
+    pct = np.empty(n)
+    pct[order] = avg_rank
+    pct /= n_valid
+    pct[~valid] = np.nan
+    return pct
 
 
 # ==================== 3. 增强的特征工程 ====================
 def create_advanced_features_v2(df, is_train=True):
     """
     创建增强版特征，重点添加物理特征和设计轨迹先验
+    全表按(井号, XJS)排序一次，逐井统计通过groupby整列计算
     """
     print(f"\n[2/9] 增强特征工程v2 {'(训练集)' if is_train else '(测试集)'}...")
     df = df.copy()
@@ -212,171 +460,204 @@ def create_advanced_features_v2(df, is_train=True):
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce')
 
-    feature_list = []
-
-    for well_id, group in tqdm(df.groupby('转换后JH'), desc="  处理井号"):
-        group = group.sort_values('XJS').reset_index(drop=True)
-        n = len(group)
-
-        features = pd.DataFrame()
-        features['id'] = group['id']
-        features['well_id'] = group['转换后JH']
-
-        # ========== 基础特征 ==========
-        features['XJS'] = group['XJS']
-        features['JX'] = group['JX']
-        features['FW'] = group['FW']
-        features['LJCZJS'] = group['LJCZJS']
-
-        # 井内相对位置
-        features['depth_pct'] = np.arange(n) / max(n-1, 1)
-
-        # ========== 核心物理特征：多阶差分和导数 ==========
-        # 一阶差分
-        jx_diff1 = group['JX'].diff().fillna(0)
-        features['JX_diff_1'] = jx_diff1
-
-        # 二阶差分（加速度）- 关键特征！
-        jx_diff2 = jx_diff1.diff().fillna(0)
-        features['JX_diff_2'] = jx_diff2
-
-        # 三阶差分（急动度）
-        features['JX_diff_3'] = jx_diff2.diff().fillna(0)
-
-        # ========== 单调性和转折点特征 ==========
-        for w in [5, 10, 15, 20]:
-            # 前向单调性
-            monotonic_inc = []
-            monotonic_dec = []
-            for i in range(n):
-                end = min(n, i + w)
-                window = group['JX'].iloc[i:end].values
-                if len(window) > 1:
-                    diffs = np.diff(window)
-                    monotonic_inc.append(int(np.all(diffs >= -0.01)))  # 单调递增或平稳
-                    monotonic_dec.append(int(np.all(diffs <= 0.01)))   # 单调递减或平稳
-                else:
-                    monotonic_inc.append(0)
-                    monotonic_dec.append(0)
-            features[f'monotonic_inc_{w}'] = monotonic_inc
-            features[f'monotonic_dec_{w}'] = monotonic_dec
-
-            # 单调性转折
-            features[f'monotonic_change_{w}'] = (
-                features[f'monotonic_inc_{w}'].diff().fillna(0).abs() +
-                features[f'monotonic_dec_{w}'].diff().fillna(0).abs()
-            )
-
-        # ========== 变化点检测特征 ==========
-        for w in [10, 20, 30]:
-            # 前后方差比
-            var_before = jx_diff1.rolling(w, min_periods=1).std().shift(1).fillna(0)
-            var_after = jx_diff1.rolling(w, min_periods=1).std().shift(-1).fillna(0)
-            features[f'variance_ratio_{w}'] = var_after / (var_before + 1e-6)
-
-            # 前后均值变化
-            mean_before = jx_diff1.rolling(w, min_periods=1).mean().shift(1).fillna(0)
-            mean_after = jx_diff1.rolling(w, min_periods=1).mean().shift(-1).fillna(0)
-            features[f'mean_change_{w}'] = mean_after - mean_before
-
-            # 前后符号变化
-            sign_before = np.sign(mean_before)
-            sign_after = np.sign(mean_after)
-            features[f'sign_change_{w}'] = (sign_before != sign_after).astype(int)
-
-        # ========== 滑窗统计特征 ==========
-        windows = [3, 5, 10, 15, 20, 30, 50]
-        for w in windows:
-            rolling = group['JX'].rolling(w, min_periods=1, center=True)
-            features[f'JX_mean_{w}'] = rolling.mean()
-            features[f'JX_std_{w}'] = rolling.std().fillna(0)
-            features[f'JX_max_{w}'] = rolling.max()
-            features[f'JX_min_{w}'] = rolling.min()
-            features[f'JX_range_{w}'] = features[f'JX_max_{w}'] - features[f'JX_min_{w}']
-
-            # 差分的滑窗
-            diff_rolling = jx_diff1.rolling(w, min_periods=1, center=True)
-            features[f'JX_diff_mean_{w}'] = diff_rolling.mean()
-            features[f'JX_diff_std_{w}'] = diff_rolling.std().fillna(0)
-
-        # ========== 局部极值特征 ==========
-        for w in [5, 10, 15]:
-            features[f'is_local_max_{w}'] = (
-                group['JX'] == group['JX'].rolling(w, center=True, min_periods=1).max()
-            ).astype(int)
-            features[f'is_local_min_{w}'] = (
-                group['JX'] == group['JX'].rolling(w, center=True, min_periods=1).min()
-            ).astype(int)
-
-        # ========== 设计轨迹特征和先验信息 ==========
-        has_design = not group['JX_design'].isna().all()
-
-        if has_design:
-            features['JX_design'] = group['JX_design'].fillna(method='ffill').fillna(method='bfill').fillna(0)
-            features['FW_design'] = group['FW_design'].fillna(method='ffill').fillna(method='bfill').fillna(0)
-            features['LJCZJS_design'] = group['LJCZJS_design'].fillna(method='ffill').fillna(method='bfill').fillna(0)
-
-            # 偏差特征
-            features['JX_deviation'] = group['JX'] - features['JX_design']
-            features['JX_deviation_abs'] = features['JX_deviation'].abs()
-            features['FW_deviation'] = group['FW'] - features['FW_design']
-            features['FW_deviation_abs'] = features['FW_deviation'].abs()
-
-            # 从设计轨迹提取先验关键点
-            design_data = group[['XJS', 'JX_design', 'LJCZJS_design']].copy()
-            design_data = design_data[~design_data['JX_design'].isna()]
-
-            if len(design_data) > 20:
-                prior_keypoints = extract_keypoints_from_design(design_data)
-
-                # DTW对齐
-                alignment_map = align_design_to_actual(design_data, group[['JX', 'LJCZJS']])
-
-                # 距离先验关键点的距离
-                for kp_type, design_idx in prior_keypoints.items():
-                    if alignment_map and design_idx in alignment_map:
-                        actual_idx = alignment_map[design_idx]
-                        dist_to_prior = np.abs(np.arange(n) - actual_idx)
-                        features[f'dist_to_prior_kp{kp_type}'] = dist_to_prior
-                        features[f'near_prior_kp{kp_type}'] = (dist_to_prior < 15).astype(int)
-                    else:
-                        features[f'dist_to_prior_kp{kp_type}'] = 999
-                        features[f'near_prior_kp{kp_type}'] = 0
+    df = df.sort_values(['转换后JH', 'XJS']).reset_index(drop=True)
+    wid = df['转换后JH']
+    g = df.groupby(wid, sort=False)
+    well_n = g['JX'].transform('size')
+
+    def ungroup(s):
+        # groupby().rolling() 结果带井号层索引，去掉后与df按行对齐
+        return s.reset_index(level=0, drop=True)
+
+    # 各列先收集为ndarray，最后一次性构建DataFrame
+    out = {}
+    out['id'] = df['id'].to_numpy()
+    out['well_id'] = wid.to_numpy()
+
+    # ========== 基础特征 ==========
+    for col in ['XJS', 'JX', 'FW', 'LJCZJS']:
+        out[col] = df[col].to_numpy()
+
+    # 井内相对位置
+    well_pos = g.cumcount().to_numpy()
+    well_n = well_n.to_numpy()
+    out['depth_pct'] = well_pos / np.maximum(well_n - 1, 1)
+
+    # ========== 核心物理特征：多阶差分和导数 ==========
+    # 一阶差分
+    jx_diff_raw = g['JX'].diff()
+    jx_diff1 = jx_diff_raw.fillna(0)
+    out['JX_diff_1'] = jx_diff1.to_numpy()
+    g_diff1 = jx_diff1.groupby(wid, sort=False)
+
+    # 二阶差分（加速度）- 关键特征！
+    jx_diff2 = g_diff1.diff().fillna(0)
+    out['JX_diff_2'] = jx_diff2.to_numpy()
+
+    # 三阶差分（急动度）
+    out['JX_diff_3'] = jx_diff2.groupby(wid, sort=False).diff().fillna(0).to_numpy()
+
+    # ========== 单调性和转折点特征 ==========
+    # 前向窗口[i, i+w)单调 <=> (i, 窗口末端)内不存在违反单调的差分
+    # 井首行差分为NaN，比较结果为False，天然阻断跨井窗口
+    pos = np.arange(len(df))
+    well_start = pos - well_pos
+    well_end = well_start + well_n
+    first_row, last_row = pos == well_start, pos == well_end - 1
+    next_break = {}
+    for name, ok in [('inc', jx_diff_raw.values >= -0.01),   # 单调递增或平稳
+                     ('dec', jx_diff_raw.values <= 0.01)]:   # 单调递减或平稳
+        # 位置k之后第一个违反单调的位置
+        breaks = np.where(ok, len(df), pos)
+        next_break[name] = np.append(np.minimum.accumulate(breaks[::-1])[::-1][1:], len(df))
+
+    for w in [5, 10, 15, 20]:
+        # 前向单调性
+        window_end = np.minimum(pos + w, well_end)
+        has_diff = window_end - pos > 1
+        monotonic_inc = ((next_break['inc'] >= window_end) & has_diff).astype(int)
+        monotonic_dec = ((next_break['dec'] >= window_end) & has_diff).astype(int)
+        out[f'monotonic_inc_{w}'] = monotonic_inc
+        out[f'monotonic_dec_{w}'] = monotonic_dec
+
+        # 单调性转折（井内一阶差分的绝对值，井首行为0）
+        out[f'monotonic_change_{w}'] = np.where(
+            first_row, 0,
+            np.abs(monotonic_inc - np.roll(monotonic_inc, 1)) +
+            np.abs(monotonic_dec - np.roll(monotonic_dec, 1))
+        )
+
+    # ========== 变化点检测特征 ==========
+    diff1 = jx_diff1.to_numpy(dtype=np.float64)
+    for w in [10, 20, 30]:
+        # 同一组尾随滑窗均值/标准差，前后两个方向只做井内平移
+        mean_w, std_w = _segment_rolling_mean_std(diff1, well_start, well_end, w - 1, 0)
+
+        # 前后方差比
+        var_before = np.where(first_row, 0, np.roll(std_w, 1))
+        var_after = np.where(last_row, 0, np.roll(std_w, -1))
+        out[f'variance_ratio_{w}'] = var_after / (var_before + 1e-6)
+
+        # 前后均值变化
+        mean_before = np.where(first_row, 0, np.roll(mean_w, 1))
+        mean_after = np.where(last_row, 0, np.roll(mean_w, -1))
+        out[f'mean_change_{w}'] = mean_after - mean_before
+
+        # 前后符号变化
+        sign_before = np.sign(mean_before)
+        sign_after = np.sign(mean_after)
+        out[f'sign_change_{w}'] = (sign_before != sign_after).astype(int)
+
+    # ========== 滑窗统计特征 ==========
+    windows = [3, 5, 10, 15, 20, 30, 50]
+    for w in windows:
+        jx_stats = ungroup(g['JX'].rolling(w, min_periods=1, center=True).agg(['mean', 'std', 'max', 'min']))
+        out[f'JX_mean_{w}'] = jx_stats['mean'].to_numpy()
+        out[f'JX_std_{w}'] = jx_stats['std'].fillna(0).to_numpy()
+        out[f'JX_max_{w}'] = jx_stats['max'].to_numpy()
+        out[f'JX_min_{w}'] = jx_stats['min'].to_numpy()
+        out[f'JX_range_{w}'] = out[f'JX_max_{w}'] - out[f'JX_min_{w}']
+
+        # 差分的滑窗（居中窗口）
+        diff_mean, diff_std = _segment_rolling_mean_std(diff1, well_start, well_end, w // 2, (w - 1) // 2)
+        out[f'JX_diff_mean_{w}'] = diff_mean
+        out[f'JX_diff_std_{w}'] = diff_std
+
+    # ========== 局部极值特征 ==========
+    # 与滑窗统计同为居中窗口，直接复用JX_max_w/JX_min_w
+    for w in [5, 10, 15]:
+        out[f'is_local_max_{w}'] = (out['JX'] == out[f'JX_max_{w}']).astype(int)
+        out[f'is_local_min_{w}'] = (out['JX'] == out[f'JX_min_{w}']).astype(int)
+
+    # ========== 设计轨迹特征和先验信息 ==========
+    has_design = df['JX_design'].notna().groupby(wid, sort=False).transform('any')
+
+    design_mask = has_design.to_numpy()
+    for col in ['JX_design', 'FW_design', 'LJCZJS_design']:
+        filled = _segment_fill(df[col].to_numpy(dtype=np.float64), well_start, well_end)
+        out[col] = np.where(design_mask, filled, 0)
+
+    # 偏差特征
+    out['JX_deviation'] = np.where(design_mask, out['JX'] - out['JX_design'], 0)
+    out['JX_deviation_abs'] = np.abs(out['JX_deviation'])
+    out['FW_deviation'] = np.where(design_mask, out['FW'] - out['FW_design'], 0)
+    out['FW_deviation_abs'] = np.abs(out['FW_deviation'])
+
+    # 距离先验关键点的距离（默认无先验）
+    dist_to_prior = {kp_type: np.full(len(df), 999.0) for kp_type in [1, 2, 3]}
+    near_prior = {kp_type: np.zeros(len(df)) for kp_type in [1, 2, 3]}
+
+    for well_id, group in tqdm(df[has_design].groupby('转换后JH', sort=False), desc="  设计轨迹先验"):
+        # 从设计轨迹提取先验关键点
+        design_data = group[['XJS', 'JX_design', 'LJCZJS_design']]
+        design_data = design_data[~design_data['JX_design'].isna()]
+        if len(design_data) <= 20:
+            continue
+
+        start, end = group.index[0], group.index[-1] + 1
+        prior_keypoints = extract_keypoints_from_design(design_data)
+
+        # 未提取到的先验关键点记为缺失，清洗阶段填0
+        for kp_type in [1, 2, 3]:
+            dist_to_prior[kp_type][start:end] = np.nan
+            near_prior[kp_type][start:end] = np.nan
+
+        # 没有先验关键点时无需DTW对齐
+        if not prior_keypoints:
+            continue
+
+        # DTW对齐
+        alignment_map = align_design_to_actual(design_data, group[['JX', 'LJCZJS']])
+
+        for kp_type, design_idx in prior_keypoints.items():
+            actual_idx = alignment_map[design_idx] if alignment_map is not None else -1
+            if actual_idx >= 0:
+                dist = np.abs(np.arange(end - start) - actual_idx)
+                dist_to_prior[kp_type][start:end] = dist
+                near_prior[kp_type][start:end] = (dist < 15).astype(int)
             else:
-                for kp_type in [1, 2, 3]:
-                    features[f'dist_to_prior_kp{kp_type}'] = 999
-                    features[f'near_prior_kp{kp_type}'] = 0
-        else:
-            for feat in ['JX_design', 'FW_design', 'LJCZJS_design',
-                        'JX_deviation', 'JX_deviation_abs', 
-                        'FW_deviation', 'FW_deviation_abs']:
-                features[feat] = 0
-            for kp_type in [1, 2, 3]:
-                features[f'dist_to_prior_kp{kp_type}'] = 999
-                features[f'near_prior_kp{kp_type}'] = 0
-
-        # ========== 井级别全局特征 ==========
-        features['well_max_jx'] = group['JX'].max()
-        features['well_min_jx'] = group['JX'].min()
-        features['well_mean_jx'] = group['JX'].mean()
-        features['well_total_depth'] = group['XJS'].max()
-        features['well_n_points'] = n
-
-        # 当前JX在全井中的百分位
-        features['jx_percentile'] = group['JX'].rank(pct=True)
-
-        # 标签
-        if is_train and '关键点' in group.columns:
-            features['label'] = group['关键点'].values
-
-        feature_list.append(features)
-
-    result_df = pd.concat(feature_list, ignore_index=True)
-
-    # 数据清洗
-    numeric_cols = result_df.select_dtypes(include=[np.number]).columns
-    result_df[numeric_cols] = result_df[numeric_cols].replace([np.inf, -np.inf], np.nan)
-    result_df[numeric_cols] = result_df[numeric_cols].fillna(0)
+                dist_to_prior[kp_type][start:end] = 999
+                near_prior[kp_type][start:end] = 0
+
+    for kp_type in [1, 2, 3]:
+        out[f'dist_to_prior_kp{kp_type}'] = dist_to_prior[kp_type]
+        out[f'near_prior_kp{kp_type}'] = near_prior[kp_type]
+
+    # ========== 井级别全局特征 ==========
+    # 数据按井连续存放，按井边界一次规约后广播回各行
+    jx = out['JX'].astype(np.float64)
+    jx_valid = ~np.isnan(jx)
+    well_sizes = g.size().to_numpy()
+    well_starts = np.r_[0, np.cumsum(well_sizes)[:-1]]
+    well_jx_sum = np.add.reduceat(np.where(jx_valid, jx, 0), well_starts)
+    well_jx_count = np.add.reduceat(jx_valid, well_starts)
+
+    out['well_max_jx'] = np.repeat(np.fmax.reduceat(jx, well_starts), well_sizes)
+    out['well_min_jx'] = np.repeat(np.fmin.reduceat(jx, well_starts), well_sizes)
+    out['well_mean_jx'] = np.repeat(well_jx_sum / well_jx_count, well_sizes)
+    out['well_total_depth'] = np.repeat(np.fmax.reduceat(out['XJS'].astype(np.float64), well_starts), well_sizes)
+    out['well_n_points'] = well_n
+
+    # 当前JX在全井中的百分位
+    out['jx_percentile'] = _segment_pct_rank(jx, well_starts, well_sizes)
+
+    # 标签
+    if is_train and '关键点' in df.columns:
+        out['label'] = df['关键点'].to_numpy()
+
+    # 数据清洗：inf/NaN置0
+    # 0/1指示及计数特征存为int8，其余特征存为float32（树模型内部同样使用float32）
+    flag_prefixes = ('monotonic_', 'sign_change_', 'is_local_', 'near_prior_kp')
+    for col, values in out.items():
+        if col in ('id', 'well_id', 'label'):
+            # 保持原dtype，仅清洗数值型列
+            if np.issubdtype(values.dtype, np.number):
+                out[col] = np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0)
+            continue
+        values = np.nan_to_num(values.astype(np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+        out[col] = values.astype(np.int8) if col.startswith(flag_prefixes) else values
+
+    result_df = pd.DataFrame(out, copy=False)
 
     print(f"  完成！共生成 {len(result_df.columns)} 列特征")
     return result_df
@@ -390,50 +671,44 @@ def sample_hard_negatives(df, window=50, ratio=0.3):
     print("\n[3/9] 困难负样本采样...")
 
     sampled_list = []
+    all_labels = df['label'].to_numpy()
 
-    for well_id in df['well_id'].unique():
-        group = df[df['well_id'] == well_id].copy()
+    # 一次分组得到各井的行位置，避免逐井全表扫描
+    for well_id, positions in df.groupby('well_id', sort=False).indices.items():
+        labels = all_labels[positions]
+        n = len(labels)
 
         # 找出所有关键点
-        keypoint_indices = group[group['label'] != 0].index.tolist()
+        kp_positions = np.flatnonzero(labels != 0)
 
-        if len(keypoint_indices) == 0:
+        if len(kp_positions) == 0:
             # 没有关键点的井，随机采样负样本
-            neg_indices = group[group['label'] == 0].index
-            if len(neg_indices) > 0:
-                n_sample = max(1, int(len(neg_indices) * ratio))
-                sampled_neg = np.random.choice(neg_indices, size=n_sample, replace=False)
-                sampled_list.append(group.loc[sampled_neg])
+            if n > 0:
+                n_sample = max(1, int(n * ratio))
+                sampled_list.append(np.random.choice(positions, size=n_sample, replace=False))
         else:
             # 保留所有关键点
-            sampled_list.append(group[group['label'] != 0])
+            keep_mask = labels != 0
 
             # 困难负样本：关键点前后window范围内
-            hard_neg_indices = set()
-            for kp_idx in keypoint_indices:
-                kp_pos = group.index.get_loc(kp_idx)
-                start = max(0, kp_pos - window)
-                end = min(len(group), kp_pos + window + 1)
-                for pos in range(start, end):
-                    idx = group.index[pos]
-                    if group.loc[idx, 'label'] == 0:
-                        hard_neg_indices.add(idx)
-
-            if hard_neg_indices:
-                sampled_list.append(group.loc[list(hard_neg_indices)])
+            hard_pos = (kp_positions[:, None] + np.arange(-window, window + 1)).ravel()
+            hard_mask = np.zeros(n, dtype=bool)
+            hard_mask[hard_pos[(hard_pos >= 0) & (hard_pos < n)]] = True
+            hard_mask &= labels == 0
+            keep_mask |= hard_mask
 
             # 简单负样本：随机采样
-            all_neg_indices = set(group[group['label'] == 0].index.tolist())
-            easy_neg_indices = all_neg_indices - hard_neg_indices
+            easy_positions = np.flatnonzero((labels == 0) & ~hard_mask)
+            if len(easy_positions) > 0:
+                n_easy_sample = max(1, int(len(easy_positions) * ratio))
+                sampled_easy = np.random.choice(easy_positions,
+                                                size=min(n_easy_sample, len(easy_positions)),
+                                                replace=False)
+                keep_mask[sampled_easy] = True
 
-            if easy_neg_indices:
-                n_easy_sample = max(1, int(len(easy_neg_indices) * ratio))
-                sampled_easy = np.random.choice(list(easy_neg_indices), 
-                                              size=min(n_easy_sample, len(easy_neg_indices)), 
-                                              replace=False)
-                sampled_list.append(group.loc[sampled_easy])
+            sampled_list.append(positions[keep_mask])
 
-    result = pd.concat(sampled_list, ignore_index=False).sort_index()
+    result = df.iloc[np.sort(np.concatenate(sampled_list))]
 
     print(f"  原始样本数: {len(df)}")
     print(f"  采样后样本数: {len(result)}")
@@ -443,99 +718,134 @@ def sample_hard_negatives(df, window=50, ratio=0.3):
 
 
 # ==================== 6. 动态规划后处理 ==========
-def dp_post_process(well_data, model_proba, prior_info=None):
+@njit(cache=True, nogil=True)
+def _dp_search(jx, jx_diff, model_proba, prior, top_k):
     """
-    使用动态规划搜索最优关键点组合
-    考虑：
-    1. 物理约束（顺序、间距）
-    2. 模型置信度
-    3. 先验信息
-    4. 容错扩展
+    候选搜索与组合打分（numba编译）
+    prior: 长度4的先验位置数组，下标1~3对应关键点类型，-1表示无先验
+    top_k: (4, K)的候选位置数组，第kp行为该类关键点置信度最高的K个位置
+    返回长度4的位置数组，-1表示该类关键点未选出
     """
-    n = len(well_data)
-    jx = well_data['JX'].values
-    jx_diff = np.diff(jx, prepend=jx[0])
+    n = len(jx)
+    K = top_k.shape[1]
 
     # 为每种关键点找候选位置（top-K个高置信度）
-    candidates = {1: [], 2: [], 3: []}
-    K = 10  # 每类保留top-K个候选
+    cand_idx = np.zeros((4, K), dtype=np.int64)
+    cand_score = np.zeros((4, K))
+    cand_n = np.zeros(4, dtype=np.int64)
 
-    for kp in [1, 2, 3]:
+    for kp in range(1, 4):
         # 基础候选：模型高置信度位置
         kp_proba = model_proba[:, kp]
-        top_k_indices = np.argsort(kp_proba)[-K:]
+        top_k_indices = top_k[kp]
 
+        m = 0
+        idx_buf = np.zeros(K, dtype=np.int64)
+        score_buf = np.zeros(K)
         for idx in top_k_indices:
             if kp_proba[idx] > 0.1:  # 最低置信度阈值
                 score = kp_proba[idx]
 
                 # 物理特征检查
-                phys_score = 0
-                if kp == 1:  # 增斜点：要求后续井斜角增大
-                    if idx < n - 10:
-                        future_trend = jx[idx+1:idx+11].mean() - jx[idx]
-                        if future_trend > 0.5:
-                            phys_score = 0.3
-                elif kp == 2:  # 稳斜点：要求井斜角变化小
+                phys_score = 0.0
+                if kp == 2:  # 稳斜点：要求井斜角变化小
                     if idx >= 10 and idx < n - 10:
-                        local_std = jx_diff[idx-10:idx+10].std()
-                        if local_std < 0.2:
-                            phys_score = 0.3
-                elif kp == 3:  # 降斜点：要求后续井斜角减小
-                    if idx < n - 10:
-                        future_trend = jx[idx+1:idx+11].mean() - jx[idx]
-                        if future_trend < -0.3:
+                        local_mean = 0.0
+                        for j in range(idx - 10, idx + 10):
+                            local_mean += jx_diff[j]
+                        local_mean /= 20
+                        local_var = 0.0
+                        for j in range(idx - 10, idx + 10):
+                            local_var += (jx_diff[j] - local_mean) ** 2
+                        if np.sqrt(local_var / 20) < 0.2:
                             phys_score = 0.3
+                elif idx < n - 10:  # 增斜点/降斜点：要求后续井斜角增大/减小
+                    future_mean = 0.0
+                    for j in range(idx + 1, idx + 11):
+                        future_mean += jx[j]
+                    future_trend = future_mean / 10 - jx[idx]
+                    if (kp == 1 and future_trend > 0.5) or (kp == 3 and future_trend < -0.3):
+                        phys_score = 0.3
 
                 # 先验信息加权
-                prior_score = 0
-                if prior_info and kp in prior_info:
-                    dist = abs(idx - prior_info[kp])
+                prior_score = 0.0
+                if prior[kp] >= 0:
+                    dist = abs(idx - prior[kp])
                     if dist < 15:
                         prior_score = 0.2 * (1 - dist / 15)
 
-                total_score = score + phys_score + prior_score
-                candidates[kp].append((idx, total_score))
+                idx_buf[m] = idx
+                score_buf[m] = score + phys_score + prior_score
+                m += 1
 
-        # 按分数排序
-        candidates[kp].sort(key=lambda x: x[1], reverse=True)
+        # 按分数排序（稳定排序，同分保持原顺序）
+        order = np.argsort(-score_buf[:m], kind='mergesort')
+        for r in range(m):
+            cand_idx[kp, r] = idx_buf[order[r]]
+            cand_score[kp, r] = score_buf[order[r]]
+        cand_n[kp] = m
 
     # 动态规划找最优组合
-    best_combo = None
-    best_score = -1
+    best_combo = np.full(4, -1, dtype=np.int64)
+    best_score = -1.0
+    n1, n2, n3 = min(cand_n[1], 5), min(cand_n[2], 5), min(cand_n[3], 5)
 
     # 遍历所有可能的组合
-    for kp1_idx, kp1_score in candidates[1][:5]:  # 增斜点候选
-        for kp2_idx, kp2_score in candidates[2][:5]:  # 稳斜点候选
+    for a in range(n1):  # 增斜点候选
+        kp1_idx, kp1_score = cand_idx[1, a], cand_score[1, a]
+        for b in range(n2):  # 稳斜点候选
+            kp2_idx, kp2_score = cand_idx[2, b], cand_score[2, b]
             # 约束：稳斜点必须在增斜点之后至少20个点
             if kp2_idx < kp1_idx + 20:
                 continue
 
-            for kp3_idx, kp3_score in candidates[3][:5] + [(None, 0)]:  # 降斜点候选（可选）
-                # 约束：降斜点必须在稳斜点之后至少20个点
-                if kp3_idx is not None and kp3_idx < kp2_idx + 20:
-                    continue
-
-                # 计算组合得分
-                combo_score = kp1_score + kp2_score + (kp3_score if kp3_idx is not None else 0)
+            for c in range(n3 + 1):  # 降斜点候选（可选），c == n3 表示不选
+                if c < n3:
+                    kp3_idx = cand_idx[3, c]
+                    # 约束：降斜点必须在稳斜点之后至少20个点
+                    if kp3_idx < kp2_idx + 20:
+                        continue
+                    combo_score = kp1_score + kp2_score + cand_score[3, c]
+                else:
+                    kp3_idx = -1
+                    combo_score = kp1_score + kp2_score
 
                 if combo_score > best_score:
                     best_score = combo_score
-                    if kp3_idx is not None:
-                        best_combo = {1: kp1_idx, 2: kp2_idx, 3: kp3_idx}
-                    else:
-                        best_combo = {1: kp1_idx, 2: kp2_idx}
+                    best_combo[1] = kp1_idx
+                    best_combo[2] = kp2_idx
+                    best_combo[3] = kp3_idx
 
     # 如果没有找到有效组合，使用最高置信度的单个点
-    if best_combo is None:
-        best_combo = {}
-        for kp in [1, 2, 3]:
-            if candidates[kp]:
-                best_combo[kp] = candidates[kp][0][0]
+    if best_score < 0:
+        for kp in range(1, 4):
+            if cand_n[kp] > 0:
+                best_combo[kp] = cand_idx[kp, 0]
 
     return best_combo
 
 
+def dp_post_process(jx, model_proba, prior_info):
+    """
+    使用动态规划搜索最优关键点组合
+    考虑：
+    1. 物理约束（顺序、间距）
+    2. 模型置信度
+    3. 先验信息（长度4的位置数组，-1表示无先验）
+    4. 容错扩展
+    返回长度4的位置数组，-1表示该类关键点未选出
+    """
+    jx_diff = np.diff(jx, prepend=jx[0])
+
+    # top-K候选用numpy选出（numba的argsort在同分时顺序不同）
+    K = min(10, len(jx))  # 每类保留top-K个候选
+    top_k = np.zeros((4, K), dtype=np.int64)
+    for kp in [1, 2, 3]:
+        top_k[kp] = np.argsort(model_proba[:, kp])[-K:]
+
+    return _dp_search(jx, jx_diff, model_proba, prior_info, top_k)
+
+
 def advanced_post_process(test_features, tree_preds, dl_preds, weights):
     """
     增强版后处理流程
@@ -551,30 +861,40 @@ def advanced_post_process(test_features, tree_preds, dl_preds, weights):
 
     final_predictions = np.zeros(len(test_features), dtype=int)
 
-    # 逐井处理
-    for well_id in tqdm(test_features['well_id'].unique(), desc="  逐井后处理"):
-        mask = test_features['well_id'] == well_id
-        group = test_features[mask].reset_index(drop=True)
-        group_indices = np.where(mask)[0]
-        group_proba = final_proba[group_indices]
+    # 按井号稳定排序一次（井内保持原行序），求出各井边界；order用于回写原行位置
+    order = np.argsort(test_features['well_id'].to_numpy(), kind='stable')
+    _, starts, counts = np.unique(test_features['well_id'].to_numpy()[order], return_index=True, return_counts=True)
+
+    jx = test_features['JX'].to_numpy(dtype=np.float64)[order]
+    final_proba_sorted = final_proba[order]
+    prior_dists = {
+        kp: test_features[f'dist_to_prior_kp{kp}'].to_numpy()[order]
+        for kp in [1, 2, 3] if f'dist_to_prior_kp{kp}' in test_features.columns
+    }
+
+    def process_well(start, count):
+        end = start + count
 
         # 提取先验信息
-        prior_keypoints = {}
-        for kp in [1, 2, 3]:
-            col_name = f'dist_to_prior_kp{kp}'
-            if col_name in group.columns:
-                dists = group[col_name].values
-                if dists.min() < 900:  # 有有效先验
-                    prior_keypoints[kp] = int(dists.argmin())
+        prior_keypoints = np.full(4, -1, dtype=np.int64)
+        for kp, dists in prior_dists.items():
+            if dists[start:end].min() < 900:  # 有有效先验
+                prior_keypoints[kp] = dists[start:end].argmin()
 
         # 动态规划搜索
-        best_combo = dp_post_process(group, group_proba, prior_keypoints)
+        return dp_post_process(jx[start:end], final_proba_sorted[start:end], prior_keypoints)
+
+    # 各井相互独立，多线程并行（_dp_search执行时释放GIL）
+    best_combos = Parallel(n_jobs=-1, prefer='threads')(
+        delayed(process_well)(start, count)
+        for start, count in tqdm(zip(starts, counts), total=len(starts), desc="  逐井后处理")
+    )
 
-        # 标记关键点
-        for kp, idx in best_combo.items():
-            if 0 <= idx < len(group):
-                global_idx = group_indices[idx]
-                final_predictions[global_idx] = kp
+    # 标记关键点
+    best_combos = np.array(best_combos).reshape(-1, 4)
+    for kp in [1, 2, 3]:
+        found = best_combos[:, kp] >= 0
+        final_predictions[order[starts[found] + best_combos[found, kp]]] = kp
 
     return final_predictions
 
@@ -582,7 +902,6 @@ def advanced_post_process(test_features, tree_preds, dl_preds, weights):
 def inference_only(input_path, output_path):
     print("\n[1/9] 加载数据...")
     input_file = os.path.join(input_path, 'test_without_label.csv')
-    train_df = pd.read_csv('utils/train.csv')
     test_df = pd.read_csv(input_file)
 
     # 过滤测试集
@@ -592,82 +911,33 @@ def inference_only(input_path, output_path):
     mask = (test_df['JX_design'].isna() & test_df['FW_design'].isna() & test_df['LJCZJS_design'].isna())
     test_df = test_df[mask].copy()
 
-    print(f"  训练集: {train_df.shape}, 测试集: {test_df.shape}")
+    print(f"  测试集: {test_df.shape}")
 
     # 2. 增强特征工程
-    train_features = create_advanced_features_v2(train_df, is_train=True)
     test_features = create_advanced_features_v2(test_df, is_train=False)
 
-    # 3. 困难负样本采样
-    train_features_sampled = sample_hard_negatives(
-        train_features,
-        window=Config.HARD_NEGATIVE_WINDOW,
-        ratio=Config.NEGATIVE_SAMPLE_RATIO
-    )
-
-    # 4. 准备特征
-    print("\n[4/9] 准备特征...")
-    exclude_cols = ['id', 'well_id', 'label']
-    feature_cols = [col for col in train_features_sampled.columns if col not in exclude_cols]
-
-    # 确保测试集特征一致
-    for col in feature_cols:
-        if col not in test_features.columns:
-            test_features[col] = 0
-
-    X = train_features_sampled[feature_cols].values
-    y = train_features_sampled['label'].values
-    well_ids = train_features_sampled['well_id'].values
-
-    X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
-
-    # 方差过滤
-    selector = VarianceThreshold(threshold=0.001)
-    X = selector.fit_transform(X)
-    feature_cols_filtered = [f for f, m in zip(feature_cols, selector.get_support()) if m]
-    print(f"  特征数: {len(feature_cols_filtered)}")
-
-    # 划分训练/验证集
-    unique_wells = np.unique(well_ids)
-    train_wells, val_wells = train_test_split(unique_wells, test_size=Config.TEST_SIZE, 
-                                               random_state=Config.RANDOM_SEED)
-
-    train_mask = np.isin(well_ids, train_wells)
-    val_mask = np.isin(well_ids, val_wells)
-
-    X_train, X_val = X[train_mask], X[val_mask]
-    y_train, y_val = y[train_mask], y[val_mask]
-    well_ids_val = well_ids[val_mask]
-
-    # 标准化
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_val_scaled = scaler.transform(X_val)
-
-    # 测试集
-    X_test = test_features[feature_cols_filtered].values
-    X_test = np.nan_to_num(X_test, nan=0.0, posinf=0.0, neginf=0.0)
-    X_test_scaled = scaler.transform(X_test)
-
-    # 9. 全量训练
-    print("\n[6/9] 全量训练...")
-    X_full = scaler.fit_transform(X)
-    X_test_full = scaler.transform(X_test)
-    sample_weights_full = np.array([Config.CLASS_WEIGHTS_CLASSIFY[int(label)] for label in y])
-
-
     # 3. 加载模型和预处理对象
     print("\n[3/5] 加载模型和预处理对象...")
     
     try:
         scaler = safe_joblib_load('weights/scaler.pkl')
-        selector = safe_joblib_load('weights/feature_selector.pkl')
         feature_cols_filtered = safe_joblib_load('weights/feature_columns.pkl')
         weights = safe_joblib_load('weights/model_weights.pkl')
     except FileNotFoundError:
         print("  错误：找不到保存的模型文件，请先运行训练！")
         return None
 
+    # 4. 准备特征：按保存的特征列（已是方差过滤后的列）取值，原地标准化
+    print("\n[4/5] 准备特征...")
+    for col in feature_cols_filtered:
+        if col not in test_features.columns:
+            test_features[col] = 0
+    X_test = test_features[feature_cols_filtered].to_numpy(dtype=np.float32, copy=True)
+    np.nan_to_num(X_test, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    np.subtract(X_test, scaler.mean_, out=X_test, casting='same_kind')
+    np.divide(X_test, scaler.scale_, out=X_test, casting='same_kind')
+    print(f"  特征数: {X_test.shape[1]}")
+
     # 5. 加载模型并进行预测
     print("\n[5/5] 模型预测...")
     
@@ -680,17 +950,38 @@ def inference_only(input_path, output_path):
     cat_model = cb.CatBoostClassifier()
     cat_model.load_model('weights/cat_model.cbm')
 
-    # 生成预测概率
+    # 生成预测概率（XGBoost/CatBoost各自检测GPU，可用时在GPU上预测，任何失败均回退CPU）
+    xgb_use_gpu = xgb_cuda_available()
+    cat_use_gpu = cat_gpu_available()
+    print(f"  预测设备: XGBoost {'GPU' if xgb_use_gpu else 'CPU'}, CatBoost {'GPU' if cat_use_gpu else 'CPU'}")
+
     print("  XGBoost预测...")
-    xgb_proba = xgb_model.predict_proba(X_test_full)
+    xgb_proba = None
+    if xgb_use_gpu:
+        try:
+            xgb_model.set_params(device='cuda')
+            xgb_proba = xgb_model.predict_proba(X_test)
+        except Exception as e:
+            print(f"  XGBoost GPU预测失败，回退CPU: {e}")
+            xgb_model.set_params(device='cpu')
+    if xgb_proba is None:
+        xgb_proba = xgb_model.predict_proba(X_test)
     
+    # LightGBM的GPU后端只加速训练，预测始终在CPU上
     print("  LightGBM预测...")
-    lgb_proba = lgb_model.predict(X_test_full)
+    lgb_proba = lgb_model.predict(X_test)
     if lgb_proba.ndim == 1:  # 二分类情况
         lgb_proba = np.column_stack([1-lgb_proba, lgb_proba])
     
     print("  CatBoost预测...")
-    cat_proba = cat_model.predict_proba(X_test_full)
+    cat_proba = None
+    if cat_use_gpu:
+        try:
+            cat_proba = cat_model.predict_proba(X_test, task_type='GPU')
+        except Exception as e:
+            print(f"  CatBoost GPU预测失败，回退CPU: {e}")
+    if cat_proba is None:
+        cat_proba = cat_model.predict_proba(X_test)
 
     tree_test_preds = {
         'xgb': xgb_proba,